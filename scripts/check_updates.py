@@ -1,101 +1,556 @@
 import os
 import sys
 import yaml
-import requests
+import asyncio
+import httpx
+import functools
 import json
+import orjson
 import re
-import subprocess
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from urllib.parse import urljoin
 import hashlib
 
+from packaging.version import InvalidVersion, Version
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # 无 libyaml 时退回纯 Python 实现
+    from yaml import SafeLoader as _YamlLoader
+
+# 瞬时错误重试配置（对齐 GitHub 的限流/网关错误）
+RETRY_STATUSES = {429, 502, 503, 504}
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+
+# 预编译的热路径正则
+_PKGVER_RE = re.compile(r"PackageVersion:\s*([\d.]+)")
+_DIGITS_RE = re.compile(r"\d+")
+_JSONPATH_PART_RE = re.compile(r"([^.\[\]]+)(?:\[(\d+)\])?")
+
+
+def _version_sort_key(version_dir: str) -> Version:
+    """版本目录排序键；无法解析的目录排到最后"""
+    try:
+        return Version(version_dir.lstrip("v"))
+    except InvalidVersion:
+        return Version("0")
+
+
+@functools.lru_cache(maxsize=8)
+def _load_yaml_cached(config_path: str, mtime: float) -> Dict:
+    """按 (路径, mtime) 缓存 YAML 解析结果
+
+    解析结果另存一份按内容哈希命名的 JSON 旁路缓存，
+    温启动时 JSON 解析远快于 YAML。"""
+    with open(config_path, "rb") as f:
+        raw = f.read()
+
+    config_hash = hashlib.sha1(raw).hexdigest()
+    sidecar = Path(f".cache/config.{config_hash}.json")
+    if sidecar.exists():
+        try:
+            return orjson.loads(sidecar.read_bytes())
+        except orjson.JSONDecodeError:
+            pass
+
+    config = yaml.load(raw, Loader=_YamlLoader)
+
+    try:
+        sidecar.parent.mkdir(parents=True, exist_ok=True)
+        # 清理旧内容的旁路缓存再写入
+        for stale in sidecar.parent.glob("config.*.json"):
+            stale.unlink(missing_ok=True)
+        sidecar.write_bytes(orjson.dumps(config))
+    except (OSError, orjson.JSONEncodeError):
+        pass
+
+    return config
+
 
 class VersionChecker:
+    ETAG_CACHE_PATH = Path(".cache/winget_etags.json")
+    URL_CHECK_CACHE_PATH = Path(".cache/urlchecks.json")
+    STATE_CACHE_PATH = Path(".cache/state.json")
+    URL_CHECK_TTL = 6 * 3600  # 秒
+
     def __init__(self, config_path: str):
         self.config = self._load_config(config_path)
         self.github_token = os.environ.get("GITHUB_TOKEN", "")
         self.winget_pkgs_token = os.environ.get("WINGET_PKGS_TOKEN", "")
+        self._etag_cache = self._load_etag_cache()
+        self._url_check_cache = self._load_json_cache(self.URL_CHECK_CACHE_PATH)
+        self._state = self._load_json_cache(self.STATE_CACHE_PATH)
+        self._compile_parsers()
+        self._compile_installers()
+        self._compile_winget_paths()
+        # GraphQL 批量查询填充的单次运行缓存
+        self._latest_release_cache: Dict[str, str] = {}
+        self._winget_dirs_cache: Dict[str, List[str]] = {}
+        # 同一上游源的去重抓取任务
+        self._source_tasks: Dict[tuple, asyncio.Task] = {}
 
     def _load_config(self, config_path: str) -> Dict:
         """加载配置文件"""
-        with open(config_path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+        return _load_yaml_cached(config_path, os.path.getmtime(config_path))
+
+    def _compile_parsers(self):
+        """预编译每个包的版本解析正则"""
+        for package in self.config.get("packages", []):
+            parser = package.get("version-parser", {})
+            if parser.get("pattern"):
+                parser["_compiled"] = re.compile(parser["pattern"])
+            if parser.get("tag-filter"):
+                parser["_compiled_filter"] = re.compile(parser["tag-filter"])
+            if parser.get("path"):
+                parser["_compiled_path"] = self._compile_jsonpath(parser["path"])
+
+    def _compile_installers(self):
+        """预解析安装包 URL 模板，配置笔误在启动时就暴露"""
+        for package in self.config.get("packages", []):
+            for installer in package.get("installers", []):
+                template = installer.get("url") or installer.get("url-template")
+                if not template:
+                    raise ValueError(
+                        f"Installer without url/url-template in package "
+                        f"{package.get('id')}"
+                    )
+                installer["_template"] = template
+                installer["_needs_version"] = "{version}" in template
+
+    def _compile_winget_paths(self):
+        """预计算 winget-pkgs 路径，格式不对的 winget-id 在启动时就失败"""
+        for package in self.config.get("packages", []):
+            winget_id = package["winget-id"]
+            package_dir = self._winget_package_dir(winget_id)
+            if not package_dir:
+                raise ValueError(f"Invalid winget-id format: {winget_id}")
+            package["_winget_path"] = {
+                "dir": package_dir,
+                "manifest_file": f"{winget_id}.yaml",
+                "publisher": winget_id.split(".", 1)[0],
+            }
+
+    @staticmethod
+    def _resolve_installer_url(installer: Dict, version: str) -> str:
+        """取安装包 URL 并代入版本号"""
+        template = installer.get("_template")
+        if template is None:
+            template = installer.get("url") or installer.get("url-template")
+            needs_version = bool(template) and "{version}" in template
+        else:
+            needs_version = installer["_needs_version"]
+
+        if needs_version:
+            return template.replace("{version}", version)
+        return template
+
+    @staticmethod
+    def _compile_jsonpath(path: str) -> List:
+        """把 JSONPath 编译为 (key, index) 访问列表"""
+        return [
+            (key, int(index) if index else None)
+            for key, index in _JSONPATH_PART_RE.findall(path.lstrip("$"))
+        ]
 
-    def _get_latest_version(self, package: Dict) -> Optional[str]:
+    @staticmethod
+    def _load_json_cache(path: Path) -> Dict:
+        """加载 JSON 缓存文件"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _save_json_cache(path: Path, data: Dict):
+        """保存 JSON 缓存文件"""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            print(f"Error saving cache {path}: {e}")
+
+    def _load_etag_cache(self) -> Dict:
+        """加载 ETag 缓存"""
+        return self._load_json_cache(self.ETAG_CACHE_PATH)
+
+    def _save_etag_cache(self):
+        """保存 ETag 缓存"""
+        self._save_json_cache(self.ETAG_CACHE_PATH, self._etag_cache)
+
+    async def _request(
+        self, session: httpx.AsyncClient, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        """发起 HTTP 请求，对瞬时错误指数退避重试"""
+        for attempt in range(RETRY_TOTAL + 1):
+            response = await session.request(method, url, **kwargs)
+            if response.status_code in RETRY_STATUSES and attempt < RETRY_TOTAL:
+                await response.aclose()
+                await asyncio.sleep(RETRY_BACKOFF * (2**attempt))
+                continue
+            return response
+        return response
+
+    @staticmethod
+    def _winget_package_dir(winget_id: str) -> Optional[str]:
+        """将 winget-id 转换为 manifests 目录路径
+        例如: aome510.spotify-player -> manifests/a/aome510/spotify-player"""
+        parts = winget_id.split(".")
+        if len(parts) < 2:
+            return None
+
+        publisher = parts[0]
+        package_name = ".".join(parts[1:])
+        first_letter = publisher[0].lower()
+        return f"manifests/{first_letter}/{publisher}/{package_name}"
+
+    async def _github_graphql_batch(
+        self, session: httpx.AsyncClient, packages: List[Dict]
+    ):
+        """用一次 GraphQL 请求批量获取上游 release 和 winget 版本目录"""
+        if not self.github_token:
+            return
+
+        fields = []
+        release_aliases = {}  # alias -> "owner/repo"
+        dir_aliases = {}  # alias -> winget_id
+        winget_fields = []
+
+        for i, package in enumerate(packages):
+            source = package["version-source"]
+            # latestRelease 不含预发布版本，这类包走 REST 列表端点
+            if source.get("type") == "github" and not source.get(
+                "include-prereleases"
+            ):
+                owner = source["owner"]
+                repo = source["repo"]
+                alias = f"repo{i}"
+                release_aliases[alias] = f"{owner}/{repo}"
+                fields.append(
+                    f'{alias}: repository(owner: "{owner}", name: "{repo}") '
+                    "{ latestRelease { tagName } }"
+                )
+
+            package_dir = package["_winget_path"]["dir"]
+            if package_dir:
+                alias = f"dir{i}"
+                dir_aliases[alias] = package["winget-id"]
+                winget_fields.append(
+                    f'{alias}: object(expression: "master:{package_dir}") '
+                    "{ ... on Tree { entries { name type } } }"
+                )
+
+        if winget_fields:
+            fields.append(
+                'winget: repository(owner: "microsoft", name: "winget-pkgs") '
+                "{ %s }" % " ".join(winget_fields)
+            )
+
+        if not fields:
+            return
+
+        query = "query { %s }" % " ".join(fields)
+        headers = {"Authorization": f"bearer {self.github_token}"}
+
+        try:
+            response = await self._request(
+                session,
+                "POST",
+                "https://api.github.com/graphql",
+                json={"query": query},
+                headers=headers,
+            )
+            response.raise_for_status()
+            payload = orjson.loads(response.content)
+        except Exception as e:
+            print(f"GraphQL batch query failed, falling back to REST: {e}")
+            return
+
+        data = payload.get("data") or {}
+
+        for alias, repo_key in release_aliases.items():
+            release = (data.get(alias) or {}).get("latestRelease") or {}
+            if release.get("tagName"):
+                self._latest_release_cache[repo_key] = release["tagName"]
+
+        winget_node = data.get("winget") or {}
+        for alias, winget_id in dir_aliases.items():
+            entries = (winget_node.get(alias) or {}).get("entries")
+            if entries:
+                self._winget_dirs_cache[winget_id] = [
+                    entry["name"] for entry in entries if entry.get("type") == "tree"
+                ]
+
+    async def _get_winget_head_sha(
+        self, session: httpx.AsyncClient
+    ) -> Optional[str]:
+        """获取 winget-pkgs master 分支头部 SHA"""
+        headers = {}
+        if self.github_token:
+            headers["Authorization"] = f"token {self.github_token}"
+
+        url = "https://api.github.com/repos/microsoft/winget-pkgs/git/ref/heads/master"
+        try:
+            response = await self._request(session, "GET", url, headers=headers)
+            if response.status_code != 200:
+                return None
+            data = orjson.loads(response.content)
+            return data.get("object", {}).get("sha")
+        except Exception as e:
+            print(f"Error fetching winget-pkgs head SHA: {e}")
+            return None
+
+    async def _prefetch_winget_dirs(
+        self, session: httpx.AsyncClient, packages: List[Dict]
+    ):
+        """按 publisher 分组预取版本目录
+
+        每个 publisher 一次 Git Trees API 调用拿到其下全部版本目录，
+        替代每包一次 contents 请求；结果按 winget-pkgs 头部 SHA 落盘，
+        仓库未动时整个预取阶段零请求。"""
+        publisher_dirs: Dict[str, List] = {}
+        for package in packages:
+            winget_id = package["winget-id"]
+            if winget_id in self._winget_dirs_cache:
+                continue
+            package_dir = package["_winget_path"]["dir"]
+            publisher_dir, _, package_name = package_dir.rpartition("/")
+            publisher_dirs.setdefault(publisher_dir, []).append(
+                (winget_id, package_name)
+            )
+
+        if not publisher_dirs:
+            return
+
+        # 头部 SHA 没变则直接复用上次的目录快照
+        head_sha = await self._get_winget_head_sha(session)
+        if head_sha:
+            tree_cache_path = Path(f".cache/tree_{head_sha}.json")
+            snapshot = self._load_json_cache(tree_cache_path)
+            if snapshot:
+                for winget_id, version_dirs in snapshot.items():
+                    self._winget_dirs_cache.setdefault(winget_id, version_dirs)
+                return
+
+        headers = {}
+        if self.github_token:
+            headers["Authorization"] = f"token {self.github_token}"
+
+        snapshot: Dict[str, List[str]] = {}
+
+        async def _fetch(publisher_dir: str, wanted: List):
+            url = (
+                "https://api.github.com/repos/microsoft/winget-pkgs/git/trees/"
+                f"master:{publisher_dir}?recursive=1"
+            )
+            try:
+                response = await self._request(session, "GET", url, headers=headers)
+                if response.status_code != 200:
+                    return
+                data = orjson.loads(response.content)
+            except Exception as e:
+                print(f"Tree prefetch failed for {publisher_dir}: {e}")
+                return
+
+            tree_paths = [
+                entry["path"]
+                for entry in data.get("tree", [])
+                if entry.get("type") == "tree"
+            ]
+            for winget_id, package_name in wanted:
+                prefix = package_name + "/"
+                version_dirs = [
+                    path[len(prefix):]
+                    for path in tree_paths
+                    if path.startswith(prefix) and "/" not in path[len(prefix):]
+                ]
+                if version_dirs:
+                    self._winget_dirs_cache[winget_id] = version_dirs
+                    snapshot[winget_id] = version_dirs
+
+        await asyncio.gather(*[_fetch(d, w) for d, w in publisher_dirs.items()])
+
+        if head_sha and snapshot:
+            # 清掉旧 SHA 的快照再写入新的
+            for stale in Path(".cache").glob("tree_*.json"):
+                stale.unlink(missing_ok=True)
+            self._save_json_cache(Path(f".cache/tree_{head_sha}.json"), snapshot)
+
+    def _fetch_source_once(self, key: tuple, coro) -> asyncio.Task:
+        """同一上游源在一次运行内只抓取一次，后来者复用同一个任务"""
+        task = self._source_tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro)
+            self._source_tasks[key] = task
+        else:
+            coro.close()
+        return task
+
+    async def _get_latest_version(
+        self, session: httpx.AsyncClient, package: Dict
+    ) -> Optional[str]:
         """获取上游最新版本"""
         version_source = package["version-source"]
         source_type = version_source.get("type")
 
         if source_type == "github":
-            return self._get_github_version(version_source, package["version-parser"])
+            return await self._get_github_version(
+                session, version_source, package["version-parser"]
+            )
         elif source_type == "api":
-            return self._get_api_version(version_source, package["version-parser"])
+            return await self._get_api_version(
+                session, version_source, package["version-parser"]
+            )
         elif source_type == "webpage":
-            return self._get_webpage_version(version_source, package["version-parser"])
+            return await self._get_webpage_version(
+                session, version_source, package["version-parser"]
+            )
         else:
             print(f"Unknown version source type: {source_type}")
             return None
 
-    def _get_github_version(self, source: Dict, parser: Dict) -> Optional[str]:
+    async def _get_github_version(
+        self, session: httpx.AsyncClient, source: Dict, parser: Dict
+    ) -> Optional[str]:
         """从 GitHub 获取版本"""
         owner = source["owner"]
         repo = source["repo"]
+        include_prereleases = source.get("include-prereleases", False)
 
-        headers = {}
+        tag_name = await self._fetch_source_once(
+            ("github", owner, repo, include_prereleases),
+            self._fetch_github_tag(session, source),
+        )
+        if not tag_name:
+            return None
+
+        # 解析和过滤按包各自的 parser 进行
+        return self._parse_version(tag_name, parser)
+
+    async def _fetch_github_tag(
+        self, session: httpx.AsyncClient, source: Dict
+    ) -> Optional[str]:
+        """抓取 GitHub 最新 release 的 tag"""
+        owner = source["owner"]
+        repo = source["repo"]
+        include_prereleases = source.get("include-prereleases", False)
+
+        # GraphQL 批量查询已拿到 tag 时直接使用
+        # (latestRelease 不含预发布版本，只对默认路径有效)
+        if not include_prereleases:
+            cached_tag = self._latest_release_cache.get(f"{owner}/{repo}")
+            if cached_tag:
+                return cached_tag
+
+        headers = {"Accept": "application/vnd.github+json"}
         if self.github_token:
             headers["Authorization"] = f"token {self.github_token}"
 
+        if include_prereleases:
+            # /releases/latest 只返回正式版本；预发布要看版本列表第一条
+            cache_key = f"releases-pre:{owner}/{repo}"
+            url = f"https://api.github.com/repos/{owner}/{repo}/releases?per_page=1"
+        else:
+            cache_key = f"release:{owner}/{repo}"
+            url = f"https://api.github.com/repos/{owner}/{repo}/releases/latest"
+
+        cached = self._etag_cache.get(cache_key, {})
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+
         try:
             # 获取最新 release
-            url = f"https://api.github.com/repos/{owner}/{repo}/releases/latest"
-            response = requests.get(url, headers=headers, timeout=30)
+            response = await self._request(session, "GET", url, headers=headers)
+
+            # 304: release 未变化，直接使用缓存的 tag
+            if response.status_code == 304:
+                return cached.get("tag", "")
+
             response.raise_for_status()
-            data = response.json()
-            tag_name = data.get("tag_name", "")
+            etag = response.headers.get("ETag")
+            data = orjson.loads(response.content)
+
+            # 只取 tag_name，assets 等其余字段直接丢弃
+            if include_prereleases:
+                tag_name = data[0].get("tag_name", "") if data else ""
+            else:
+                tag_name = data.get("tag_name", "")
+
+            if etag:
+                self._etag_cache[cache_key] = {"etag": etag, "tag": tag_name}
 
-            # 解析版本
-            return self._parse_version(tag_name, parser)
+            return tag_name
         except Exception as e:
             print(f"Error fetching GitHub version for {owner}/{repo}: {e}")
             return None
 
-    def _get_api_version(self, source: Dict, parser: Dict) -> Optional[str]:
+    async def _get_api_version(
+        self, session: httpx.AsyncClient, source: Dict, parser: Dict
+    ) -> Optional[str]:
         """从 API 获取版本"""
         url = source["url"]
         method = source.get("method", "GET")
 
-        try:
-            if method == "GET":
-                response = requests.get(url, timeout=30)
-            else:
-                response = requests.request(method, url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+        data = await self._fetch_source_once(
+            ("api", method, url), self._fetch_api_data(session, method, url)
+        )
+        if data is None:
+            return None
 
+        try:
             # 使用 JSONPath 解析版本
-            path = parser["path"]
-            version = self._get_jsonpath_value(data, path)
+            compiled_path = parser.get("_compiled_path")
+            if compiled_path is None:
+                compiled_path = self._compile_jsonpath(parser["path"])
+            version = self._get_jsonpath_value(data, compiled_path)
             return version
+        except Exception as e:
+            print(f"Error parsing API version from {url}: {e}")
+            return None
+
+    async def _fetch_api_data(
+        self, session: httpx.AsyncClient, method: str, url: str
+    ) -> Optional[Any]:
+        """抓取并解析 API JSON"""
+        try:
+            response = await self._request(session, method, url)
+            response.raise_for_status()
+            return orjson.loads(response.content)
         except Exception as e:
             print(f"Error fetching API version from {url}: {e}")
             return None
 
-    def _get_webpage_version(self, source: Dict, parser: Dict) -> Optional[str]:
+    async def _get_webpage_version(
+        self, session: httpx.AsyncClient, source: Dict, parser: Dict
+    ) -> Optional[str]:
         """从网页获取版本"""
         url = source["url"]
 
+        content = await self._fetch_source_once(
+            ("webpage", url), self._fetch_text(session, url)
+        )
+        if content is None:
+            return None
+
+        # 使用正则解析版本
+        pattern = parser.get("_compiled") or re.compile(parser["pattern"])
+        match = pattern.search(content)
+        if match:
+            return match.group(1)
+        return None
+
+    async def _fetch_text(
+        self, session: httpx.AsyncClient, url: str
+    ) -> Optional[str]:
+        """抓取网页正文"""
         try:
-            response = requests.get(url, timeout=30)
+            response = await self._request(session, "GET", url)
             response.raise_for_status()
-            content = response.text
-
-            # 使用正则解析版本
-            pattern = parser["pattern"]
-            match = re.search(pattern, content)
-            if match:
-                return match.group(1)
-            return None
+            return response.text
         except Exception as e:
             print(f"Error fetching webpage version from {url}: {e}")
             return None
@@ -105,15 +560,17 @@ class VersionChecker:
         parser_type = parser.get("type")
 
         if parser_type == "regex":
-            pattern = parser["pattern"]
-            tag_filter = parser.get("tag-filter")
+            pattern = parser.get("_compiled") or re.compile(parser["pattern"])
+            tag_filter = parser.get("_compiled_filter")
+            if tag_filter is None and parser.get("tag-filter"):
+                tag_filter = re.compile(parser["tag-filter"])
 
             # 应用标签过滤
-            if tag_filter and not re.match(tag_filter, raw_version):
-                print(f"Tag {raw_version} does not match filter {tag_filter}")
+            if tag_filter and not tag_filter.match(raw_version):
+                print(f"Tag {raw_version} does not match filter {tag_filter.pattern}")
                 return None
 
-            match = re.search(pattern, raw_version)
+            match = pattern.search(raw_version)
             if match:
                 return match.group(1)
             return None
@@ -122,87 +579,120 @@ class VersionChecker:
 
         return raw_version
 
-    def _get_jsonpath_value(self, data: Any, path: str) -> Any:
-        """简单的 JSONPath 实现"""
-        # 移除前导 $
-        path = path.lstrip("$")
-        parts = path.split(".")
-
+    def _get_jsonpath_value(self, data: Any, compiled_path: List) -> Any:
+        """沿预编译的 (key, index) 列表取值"""
         value = data
-        for part in parts:
-            if "[" in part and part.endswith("]"):
-                key = part.split("[")[0]
-                index = int(part.split("[")[1].rstrip("]"))
-                value = value[key][index]
-            else:
-                value = value[part]
+        for key, index in compiled_path:
+            value = value[key]
+            if index is not None:
+                value = value[index]
 
         return value
 
-    def _get_current_winget_version(self, package: Dict) -> Optional[str]:
+    async def _get_current_winget_version(
+        self, session: httpx.AsyncClient, package: Dict
+    ) -> Optional[str]:
         """获取当前 winget 版本"""
         winget_id = package["winget-id"]
 
         try:
-            # 将 winget-id 转换为文件路径格式
-            # 例如: aome510.spotify-player -> a/aome510/spotify-player
-            parts = winget_id.split(".")
-            if len(parts) < 2:
-                print(f"Invalid winget-id format: {winget_id}")
-                return None
+            # 路径在启动时已预计算并校验
+            winget_path = package["_winget_path"]
+            package_dir = winget_path["dir"]
 
-            publisher = parts[0]
-            package_name = ".".join(parts[1:])
-            first_letter = publisher[0].lower()
-
-            # 构建包目录路径
-            package_dir = f"manifests/{first_letter}/{publisher}/{package_name}"
-
-            # 使用 GitHub API 获取该目录下的所有版本目录
             headers = {}
             if self.github_token:
                 headers["Authorization"] = f"token {self.github_token}"
 
-            url = f"https://api.github.com/repos/microsoft/winget-pkgs/contents/{package_dir}"
-            response = requests.get(url, headers=headers, timeout=30)
+            listing_etag = None
+            version_dirs = self._winget_dirs_cache.get(winget_id)
 
-            if response.status_code == 404:
-                print(f"Package {winget_id} not found in winget-pkgs")
-                return None
+            if version_dirs is None:
+                # 使用 GitHub API 获取该目录下的所有版本目录
+                cached = self._etag_cache.get(winget_id, {})
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
 
-            response.raise_for_status()
-            data = response.json()
+                url = f"https://api.github.com/repos/microsoft/winget-pkgs/contents/{package_dir}"
+                response = await self._request(session, "GET", url, headers=headers)
+
+                if response.status_code == 404:
+                    print(f"Package {winget_id} not found in winget-pkgs")
+                    return None
 
-            # 过滤出目录（版本目录）
-            version_dirs = [dir["name"] for dir in data if dir["type"] == "dir"]
+                # 304: 目录未变化，直接使用缓存的版本
+                if response.status_code == 304:
+                    return cached.get("version")
+
+                response.raise_for_status()
+                listing_etag = response.headers.get("ETag")
+                data = orjson.loads(response.content)
+
+                headers.pop("If-None-Match", None)
+
+                # 过滤出目录（版本目录）
+                version_dirs = [dir["name"] for dir in data if dir["type"] == "dir"]
 
             if not version_dirs:
                 print(f"No version directories found for {winget_id}")
                 return None
 
-            # 找到最新的版本目录（按版本号排序）
-            version_dirs.sort(reverse=True)
+            # 找到最新的版本目录（按版本号排序，而非字典序）
+            version_dirs.sort(key=_version_sort_key, reverse=True)
             latest_version_dir = version_dirs[0]
 
+            # winget-pkgs 约定目录名就是 PackageVersion，
+            # 能解析时直接采用，省掉一次 manifest 下载
+            try:
+                Version(latest_version_dir)
+            except InvalidVersion:
+                pass
+            else:
+                if listing_etag:
+                    self._etag_cache[winget_id] = {
+                        "etag": listing_etag,
+                        "version": latest_version_dir,
+                    }
+                return latest_version_dir
+
             # 读取该版本目录的主 manifest 文件
             # 主 manifest 文件名是 {winget-id}.yaml
-            manifest_file = f"{winget_id}.yaml"
+            manifest_file = winget_path["manifest_file"]
             manifest_url = f"https://raw.githubusercontent.com/microsoft/winget-pkgs/master/{package_dir}/{latest_version_dir}/{manifest_file}"
 
-            manifest_response = requests.get(manifest_url, headers=headers, timeout=30)
-
-            if manifest_response.status_code == 404:
-                # 如果主 manifest 不存在，尝试其他文件
-                print(f"Main manifest not found, trying alternatives...")
-                return None
-
-            manifest_response.raise_for_status()
-            content = manifest_response.text
-
-            # 解析 YAML 获取版本号
-            match = re.search(r"PackageVersion:\s*([\d.]+)", content)
-            if match:
-                return match.group(1)
+            async with session.stream(
+                "GET", manifest_url, headers=headers
+            ) as manifest_response:
+                if manifest_response.status_code == 404:
+                    # 如果主 manifest 不存在，尝试其他文件
+                    print(f"Main manifest not found, trying alternatives...")
+                    return None
+
+                manifest_response.raise_for_status()
+
+                # 逐行扫描：PackageVersion 在 manifest 开头几行，
+                # 命中即停，不必解码整个 YAML
+                version = None
+                lines = []
+                async for line in manifest_response.aiter_lines():
+                    lines.append(line)
+                    if len(lines) <= 50 and line.startswith("PackageVersion:"):
+                        version = line.split(":", 1)[1].strip().strip("'\"")
+                        break
+
+            # 前 50 行没扫到时才回退到整体正则
+            if version is None:
+                match = _PKGVER_RE.search("\n".join(lines))
+                if match:
+                    version = match.group(1)
+
+            if version:
+                if listing_etag:
+                    self._etag_cache[winget_id] = {
+                        "etag": listing_etag,
+                        "version": version,
+                    }
+                return version
 
             return None
         except Exception as e:
@@ -215,23 +705,32 @@ class VersionChecker:
         v1 = v1.lstrip("v")
         v2 = v2.lstrip("v")
 
-        # 分割版本号
-        v1_parts = [int(x) for x in re.findall(r"\d+", v1)]
-        v2_parts = [int(x) for x in re.findall(r"\d+", v2)]
+        try:
+            a = Version(v1)
+            b = Version(v2)
+            return (a > b) - (a < b)
+        except InvalidVersion:
+            pass
+
+        # 回退：按数字段比较
+        t1 = self._tokenize(v1)
+        t2 = self._tokenize(v2)
 
         # 补齐长度
-        max_len = max(len(v1_parts), len(v2_parts))
-        v1_parts.extend([0] * (max_len - len(v1_parts)))
-        v2_parts.extend([0] * (max_len - len(v2_parts)))
+        if len(t1) != len(t2):
+            max_len = max(len(t1), len(t2))
+            t1 += (0,) * (max_len - len(t1))
+            t2 += (0,) * (max_len - len(t2))
 
-        # 比较
-        for a, b in zip(v1_parts, v2_parts):
-            if a > b:
-                return 1
-            elif a < b:
-                return -1
+        return (t1 > t2) - (t1 < t2)
 
-        return 0
+    @staticmethod
+    def _tokenize(version: str) -> tuple:
+        """把版本号拆成整数元组；点分数字走 str.split 快路径"""
+        try:
+            return tuple(int(part) for part in version.split("."))
+        except ValueError:
+            return tuple(int(x) for x in _DIGITS_RE.findall(version))
 
     def _generate_komac_command(self, package: Dict, new_version: str) -> List[str]:
         """生成 komac update 命令"""
@@ -248,106 +747,207 @@ class VersionChecker:
 
         # 添加每个安装包的 URL
         for installer in installers:
-            url = installer.get("url")
-            url_template = installer.get("url-template")
-
-            # 替换 {version} 占位符
-            installer_url = url if url else url_template
-            if installer_url and "{version}" in installer_url:
-                installer_url = installer_url.replace("{version}", new_version)
-
-            cmd.extend(["--urls", installer_url])
+            cmd.extend(["--urls", self._resolve_installer_url(installer, new_version)])
 
         cmd.append("--submit")
 
         return cmd
 
-    def _check_installer_urls(self, package: Dict, version: str) -> bool:
+    async def _check_installer_urls(
+        self, session: httpx.AsyncClient, package: Dict, version: str
+    ) -> bool:
         """检查安装包 URL 是否有效"""
         skip_checks = package.get("skip-checks", [])
         if "url-check" in skip_checks:
             return True
 
         installers = package.get("installers", [])
-        for installer in installers:
-            url = installer.get("url")
-            url_template = installer.get("url-template")
-
-            # 替换 {version} 占位符
-            final_url = url if url else url_template
-            if final_url and "{version}" in final_url:
-                final_url = final_url.replace("{version}", version)
-
-            try:
-                response = requests.head(final_url, allow_redirects=True, timeout=10)
-                if response.status_code >= 400:
-                    print(
-                        f"Installer URL check failed: {final_url} (Status: {response.status_code})"
-                    )
-                    return False
-            except Exception as e:
-                print(f"Error checking installer URL {final_url}: {e}")
-                return False
-
-        return True
-
-    def run_checks(self):
-        """运行版本检测"""
-        packages = self.config.get("packages", [])
-        has_updates = False
+        final_urls = [
+            self._resolve_installer_url(installer, version) for installer in installers
+        ]
 
-        for package in packages:
+        # 并发探测所有安装包 URL
+        tasks = [self._probe_url_status(session, url) for url in final_urls]
+        responses = await asyncio.gather(*tasks, return_exceptions=True)
+
+        ok = True
+        for final_url, result in zip(final_urls, responses):
+            if isinstance(result, Exception):
+                print(f"Error checking installer URL {final_url}: {result}")
+                ok = False
+            elif result >= 400:
+                print(f"Installer URL check failed: {final_url} (Status: {result})")
+                ok = False
+
+        return ok
+
+    async def _probe_url_status(
+        self, session: httpx.AsyncClient, url: str
+    ) -> int:
+        """探测 URL 可用性并返回状态码（带短 TTL 磁盘缓存）
+
+        用 Range: bytes=0-0 的 GET 代替 HEAD：部分 CDN 对 HEAD
+        响应慢或直接 403，单字节 Range GET 更可靠且同样不拉安装包。"""
+        # CI 定时运行时版本通常没变，同一 URL 的检查结果短期内可复用
+        cached = self._url_check_cache.get(url)
+        if cached and time.time() - cached.get("ts", 0) < self.URL_CHECK_TTL:
+            return cached["status"]
+
+        # 流式打开：服务器忽略 Range 返回 200 时也不会把安装包读进内存，
+        # 退出 with 即关闭连接（_request 会读完 body，这里不能用）
+        for attempt in range(RETRY_TOTAL + 1):
+            async with session.stream(
+                "GET",
+                url,
+                headers={"Range": "bytes=0-0"},
+                timeout=10,
+            ) as response:
+                if (
+                    response.status_code in RETRY_STATUSES
+                    and attempt < RETRY_TOTAL
+                ):
+                    status = None
+                else:
+                    status = response.status_code
+                    etag = response.headers.get("ETag")
+                    content_length = response.headers.get("Content-Length")
+
+            if status is not None:
+                break
+            await asyncio.sleep(RETRY_BACKOFF * (2**attempt))
+
+        # 206 (部分内容) 和 200 都视为存在
+        if status in (200, 206):
+            status = 200
+
+        # 只缓存成功结果：失败常是 asset 还没传完的瞬时 404，
+        # 缓存会把重试拖到 TTL 之后
+        if 200 <= status < 300:
+            self._url_check_cache[url] = {
+                "status": status,
+                "etag": etag,
+                "content_length": content_length,
+                "ts": time.time(),
+            }
+        else:
+            self._url_check_cache.pop(url, None)
+        return status
+
+    async def _process_package(
+        self,
+        session: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        package: Dict,
+    ) -> Optional[List[str]]:
+        """检查单个包，返回待执行的 komac 命令"""
+        async with semaphore:
             pkg_id = package["id"]
             print(f"\nChecking package: {pkg_id}")
 
             # 获取最新版本
-            latest_version = self._get_latest_version(package)
+            latest_version = await self._get_latest_version(session, package)
             if not latest_version:
                 print(f"Failed to get latest version for {pkg_id}")
-                continue
+                return None
 
             print(f"Latest version: {latest_version}")
 
+            # 上游版本等于上次确认的 winget 版本时无需再查 winget-pkgs
+            # (winget 侧版本只会由我们或他人的 PR 前进)
+            state = self._state.get(pkg_id, {})
+            if state.get("winget_version") == latest_version:
+                self._state[pkg_id] = {
+                    "latest_version": latest_version,
+                    "winget_version": state["winget_version"],
+                    "checked_at": time.time(),
+                }
+                print(f"No update needed for {pkg_id} (unchanged since last run)")
+                return None
+
             # 获取当前版本
-            current_version = self._get_current_winget_version(package)
+            current_version = await self._get_current_winget_version(session, package)
             if not current_version:
                 print(f"Failed to get current winget version for {pkg_id}")
-                continue
+                print(
+                    f"To create a new package, use: komac new --id {package['winget-id']} --version {latest_version}"
+                )
+                return None
 
             print(f"Current version: {current_version}")
 
+            self._state[pkg_id] = {
+                "latest_version": latest_version,
+                "winget_version": current_version,
+                "checked_at": time.time(),
+            }
+
             # 比较版本
             comparison = self._compare_versions(latest_version, current_version)
 
-            if not current_version:
-                # 包不存在于 winget-pkgs，需要创建新包
-                print(f"Package {package['winget-id']} not found in winget-pkgs")
-                print(
-                    f"To create a new package, use: komac new --id {package['winget-id']} --version {latest_version}"
-                )
-                continue
-
             if comparison > 0:
                 print(f"Update available: {current_version} -> {latest_version}")
 
                 # 检查安装包 URL
-                if not self._check_installer_urls(package, latest_version):
+                if not await self._check_installer_urls(
+                    session, package, latest_version
+                ):
                     print(f"Skipping update for {pkg_id}: installer URL check failed")
-                    continue
+                    return None
 
                 # 生成 komac 命令
-                komac_cmd = self._generate_komac_command(package, latest_version)
-
-                # 执行 komac update (komac 会自动创建 PR)
-                self._execute_komac_update(komac_cmd)
-
-                has_updates = True
+                return self._generate_komac_command(package, latest_version)
             else:
                 print(f"No update needed for {pkg_id}")
+                return None
+
+    async def _run_checks_async(self) -> bool:
+        """并发检查所有包"""
+        packages = self.config.get("packages", [])
+        self._source_tasks = {}
+
+        # HTTP/2: 同一主机的并发请求复用一条 TLS 连接
+        limits = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+        semaphore = asyncio.Semaphore(8)
+
+        async with httpx.AsyncClient(
+            http2=True,
+            limits=limits,
+            timeout=30.0,
+            follow_redirects=True,
+        ) as session:
+            # 先用一次 GraphQL 批量请求预热缓存（失败则各包走 REST）
+            await self._github_graphql_batch(session, packages)
+            # GraphQL 未覆盖的包按 publisher 分组预取
+            await self._prefetch_winget_dirs(session, packages)
+
+            results = await asyncio.gather(
+                *[
+                    self._process_package(session, semaphore, package)
+                    for package in packages
+                ]
+            )
 
-        return has_updates
+        self._save_etag_cache()
+        self._save_json_cache(self.URL_CHECK_CACHE_PATH, self._url_check_cache)
+        self._save_json_cache(self.STATE_CACHE_PATH, self._state)
 
-    def _execute_komac_update(self, komac_cmd: List[str]):
+        pending_commands = [cmd for cmd in results if cmd]
+
+        # 各包的 komac update 互相独立，检查结束后并发执行
+        # (komac 会自动创建 PR)
+        if pending_commands:
+            await asyncio.gather(
+                *[self._execute_komac_update(cmd) for cmd in pending_commands],
+                return_exceptions=True,
+            )
+
+        return bool(pending_commands)
+
+    def run_checks(self):
+        """运行版本检测"""
+        return asyncio.run(self._run_checks_async())
+
+    async def _execute_komac_update(self, komac_cmd: List[str]):
         """执行 komac update 命令"""
         print(f"Executing: {' '.join(komac_cmd)}")
 
@@ -357,19 +957,30 @@ class VersionChecker:
             env["GITHUB_TOKEN"] = self.winget_pkgs_token
 
         try:
-            result = subprocess.run(
-                komac_cmd, capture_output=True, text=True, timeout=300, env=env
+            proc = await asyncio.create_subprocess_exec(
+                *komac_cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
             )
 
-            if result.returncode == 0:
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    proc.communicate(), timeout=300
+                )
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.communicate()
+                print(f"komac update command timed out")
+                return
+
+            if proc.returncode == 0:
                 print(f"Successfully executed komac update")
-                print(result.stdout)
+                print(stdout.decode())
             else:
-                print(f"komac update failed with return code {result.returncode}")
-                print(f"STDOUT: {result.stdout}")
-                print(f"STDERR: {result.stderr}")
-        except subprocess.TimeoutExpired:
-            print(f"komac update command timed out")
+                print(f"komac update failed with return code {proc.returncode}")
+                print(f"STDOUT: {stdout.decode()}")
+                print(f"STDERR: {stderr.decode()}")
         except Exception as e:
             print(f"Error executing komac update: {e}")
 